@@ -11,17 +11,26 @@
 import os
 import bpy
 import bmesh
+from bmesh.types import \
+    BMFace
 import math
+import numpy as np
 from mathutils import \
     Matrix, \
     Vector
 from random import \
     Random
 import enum
-from colorsys import \
-    hls_to_rgb
+import itertools
 
 deg = math.pi / 180 # angle unit conversion factor
+# commonly-used rotations, frozen since they are shared by every ship generated
+ROT_X_90 = Matrix.Rotation(90 * deg, 4, "X").freeze()
+ROT_X_MINUS_90 = Matrix.Rotation(-90 * deg, 4, "X").freeze()
+ROT_Y_90 = Matrix.Rotation(90 * deg, 4, "Y").freeze()
+ROT_Y_5 = Matrix.Rotation(5 * deg, 4, "Y").freeze()
+ROT_Y_MINUS_5 = Matrix.Rotation(-5 * deg, 4, "Y").freeze()
+ROT_Z_MINUS_90 = Matrix.Rotation(-90 * deg, 4, "Z").freeze()
 
 DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -29,31 +38,102 @@ def resource_path(*path_components) :
     return os.path.join(DIR, *path_components)
 #end resource_path
 
+image_cache = {}
+  # names of previously-loaded images, keyed on (filename, use_alpha, is_colour)
+
+def hls_to_rgb(hls) :
+    # vectorized equivalent of colorsys.hls_to_rgb: converts an array of
+    # HLS triples, shape (..., 3), to an array of RGB triples of the same shape.
+    hls = np.asarray(hls, dtype = float)
+    h, l, s = hls[..., 0:1], hls[..., 1:2], hls[..., 2:3]
+    m2 = np.where(l <= 0.5, l * (1 + s), l + s - l * s)
+    m1 = 2 * l - m2
+    hue = (h + np.array([1 / 3, 0, -1 / 3])) % 1
+    return \
+        np.select \
+          (
+            (hue < 1 / 6, hue < 1 / 2, hue < 2 / 3),
+            (m1 + (m2 - m1) * hue * 6, m2, m1 + (m2 - m1) * (2 / 3 - hue) * 6),
+            m1
+          )
+#end hls_to_rgb
+
 def load_image(filename, use_alpha, is_colour) :
-    name = os.path.splitext(filename)[0]
-    filepath = resource_path("textures", filename)
-    image = bpy.data.images.load(filepath)
-    image.alpha_mode = ("NONE", "STRAIGHT")[use_alpha]
-    image.colorspace_settings.name = ("Non-Color", "sRGB")[is_colour]
-    image.pack()
-    # wipe all traces of original addon file path
-    image.filepath = "//textures/%s" % filename
-    image.filepath_raw = image.filepath
-    for item in image.packed_files :
-        item.filepath = image.filepath
-    #end for
+    # Returns the packed image for filename relative to my “textures”
+    # subdirectory, reusing the one from a previous call if it is still
+    # present in bpy.data.images, or else a matching one already there
+    # (e.g. from a saved .blend file, or from before the addon was
+    # reloaded).
+    key = (filename, use_alpha, is_colour)
+    alpha_mode = ("NONE", "STRAIGHT")[use_alpha]
+    colorspace = ("Non-Color", "sRGB")[is_colour]
+    internal_filepath = "//textures/%s" % filename
+
+    def is_match(image) :
+        # is image a packed copy of this texture with the right settings?
+        # Checked on the cached one too, since its name might since have
+        # been freed (e.g. by undo or loading another file) and taken by
+        # some other image.
+        return \
+            (
+                image != None
+            and
+                image.filepath_raw == internal_filepath
+            and
+                image.packed_file != None
+            and
+                image.alpha_mode == alpha_mode
+            and
+                image.colorspace_settings.name == colorspace
+            )
+    #end is_match
+
+#begin load_image
+    image = None
+    if key in image_cache :
+        image = bpy.data.images.get(image_cache[key])
+        if not is_match(image) :
+            image = None
+        #end if
+    #end if
+    if image == None :
+        for candidate in bpy.data.images :
+            if is_match(candidate) :
+                image = candidate
+                break
+            #end if
+        #end for
+    #end if
+    if image == None :
+        filepath = resource_path("textures", filename)
+        image = bpy.data.images.load(filepath)
+        image.alpha_mode = alpha_mode
+        image.colorspace_settings.name = colorspace
+        if image.packed_file == None :
+            image.pack()
+        #end if
+        # wipe all traces of original addon file path
+        image.filepath = internal_filepath
+        image.filepath_raw = image.filepath
+        for item in image.packed_files :
+            item.filepath = image.filepath
+        #end for
+    #end if
+    image_cache[key] = image.name
     return image
 #end load_image
 
 class NodeContext :
     "convenience class for assembling a nicely-laid-out node graph."
 
+    __slots__ = ("graph", "_x", "_y")
+
     def __init__(self, graph, location, clear = False) :
         "“graph” is the node tree for which to manage the addition of nodes." \
         " “location” is the initial location at which to start placing new nodes." \
         " clear indicates whether to get rid of any existing nodes or not."
         self.graph = graph
-        self._location = [location[0], location[1]]
+        self._x, self._y = location[0], location[1]
         if clear :
             for node in self.graph.nodes :
                 self.graph.nodes.remove(node)
@@ -63,27 +143,27 @@ class NodeContext :
 
     def step_across(self, width) :
         "returns the current position and advances it across by width."
-        result = self._location[:]
-        self._location[0] += width
+        result = (self._x, self._y)
+        self._x += width
         return result
     #end step_across
 
     def step_down(self, height) :
         "returns the current position and advances it down by height."
-        result = self._location[:]
-        self._location[1] -= height
+        result = (self._x, self._y)
+        self._y -= height
         return result
      #end step_down
 
     @property
     def pos(self) :
         "the current position (read/write)."
-        return (self._location[0], self._location[1])
+        return (self._x, self._y)
     #end pos
 
     @pos.setter
     def pos(self, pos) :
-        self._location[:] = [pos[0], pos[1]]
+        self._x, self._y = pos[0], pos[1]
     #end pos
 
     def node(self, type, pos) :
@@ -93,6 +173,14 @@ class NodeContext :
         return node
     #end node
 
+    def group_node(self, node_tree, pos) :
+        "creates a new group node at position “pos” that instantiates node group" \
+        " “node_tree”, and returns it."
+        node = self.node("ShaderNodeGroup", pos)
+        node.node_tree = node_tree
+        return node
+    #end group_node
+
     def link(self, frôm, to) :
         "creates a link from output “frôm” to input “to”."
         self.graph.links.new(frôm, to)
@@ -106,34 +194,24 @@ def deselect_all(material_tree) :
     #end for
 #end deselect_all
 
-def scale_face(bm, face, scale_x, scale_y, scale_z) :
-    # Scales a face in local face space. Ace!
-    face_space = get_face_matrix(face)
-    face_space.invert()
-    bmesh.ops.scale \
-      (
-        bm,
-        vec = Vector((scale_x, scale_y, scale_z)),
-        space = face_space,
-        verts = face.verts
-      )
+def scale_face(face, scale) :
+    # Scales a face uniformly about its centre. This comes out the same
+    # in any orientation, so there is no need to go via face space.
+    centre = face.calc_center_bounds()
+    for vert in face.verts :
+        vert.co = centre + (vert.co - centre) * scale
+    #end for
 #end scale_face
 
-def extrude_face(bm, face, translate_forwards = 0.0, extruded_face_list = None) :
+def extrude_face(bm, face, translate_forwards = 0.0) :
     # Extrudes a face along its normal by translate_forwards units.
-    # Returns the new face, and optionally fills out extruded_face_list
-    # with all the additional side faces created from the extrusion.
-    new_faces = bmesh.ops.extrude_discrete_faces(bm, faces = [face])["faces"]
-    if extruded_face_list != None :
-        extruded_face_list += new_faces[:]
-    #end if
-    new_face = new_faces[0]
-    bmesh.ops.translate \
-      (
-        bm,
-        vec = new_face.normal * translate_forwards,
-        verts = new_face.verts
-      )
+    # Returns the new face.
+    new_face = bmesh.ops.extrude_discrete_faces(bm, faces = [face])["faces"][0]
+    # only a handful of verts to move, cheaper to do directly than with bmesh.ops.translate
+    offset = new_face.normal * translate_forwards
+    for vert in new_face.verts :
+        vert.co += offset
+    #end for
     return new_face
 #end extrude_face
 
@@ -145,51 +223,183 @@ def ribbed_extrude_face(bm, face, translate_forwards, num_ribs = 3, rib_scale =
     for i in range(num_ribs) :
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.25)
         new_face = extrude_face(bm, new_face, 0.0)
-        scale_face(bm, new_face, rib_scale, rib_scale, rib_scale)
+        scale_face(new_face, rib_scale)
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.5)
         new_face = extrude_face(bm, new_face, 0.0)
-        scale_face(bm, new_face, 1 / rib_scale, 1 / rib_scale, 1 / rib_scale)
+        scale_face(new_face, 1 / rib_scale)
         new_face = extrude_face(bm, new_face, translate_forwards_per_rib * 0.25)
     #end for
     return new_face
 #end ribbed_extrude_face
 
+def all_geom(bm) :
+    # returns a list of all the verts, edges and faces in bm, suitable
+    # for passing as the geom/input argument to bmesh.ops.
+    return list(itertools.chain(bm.verts, bm.edges, bm.faces))
+#end all_geom
+
+cone_templates = {}
+
+def get_cone_template(segments, cap_ends = True, point1 = False, point2 = False) :
+    # Returns the (verts, faces) layout for a cone with the given number
+    # of segments, computed once and cached. verts holds (x, y, end) for
+    # each vertex, where (x, y) are coordinates around a unit circle,
+    # starting at +Y and going anticlockwise like bmesh.ops.create_cone,
+    # and end is 0 for the bottom and 1 for the top. The vertices
+    # alternate between the bottom and top rings. point1 and point2 say
+    # that the bottom or top has zero radius, in which case that end is
+    # a single vertex and the sides are triangles, as create_cone leaves
+    # it after merging doubles. faces holds the vertex indices for each
+    # side face, followed by the end caps if cap_ends.
+    key = (segments, cap_ends, point1, point2)
+    if key not in cone_templates :
+        verts = []
+        ring_index = {}
+        for i in range(segments) :
+            angle = 2 * math.pi * i / segments
+            for end, point in ((0, point1), (1, point2)) :
+                if point and i != 0 :
+                    ring_index[i, end] = ring_index[0, end]
+                else :
+                    ring_index[i, end] = len(verts)
+                    if point :
+                        verts.append((0, 0, end))
+                    else :
+                        verts.append((- math.sin(angle), math.cos(angle), end))
+                    #end if
+                #end if
+            #end for
+        #end for
+        faces = []
+        for i in range(segments) :
+            face = []
+            for j, end in ((i, 0), (i, 1), ((i - 1) % segments, 1), ((i - 1) % segments, 0)) :
+                if ring_index[j, end] not in face :
+                    face.append(ring_index[j, end])
+                #end if
+            #end for
+            if len(face) >= 3 :
+                faces.append(tuple(face))
+            #end if
+        #end for
+        if cap_ends :
+            if not point1 :
+                faces.append(tuple(ring_index[i, 0] for i in reversed(range(segments))))
+            #end if
+            if not point2 :
+                faces.append(tuple(ring_index[i, 1] for i in range(segments)))
+            #end if
+        #end if
+        cone_templates[key] = (tuple(verts), tuple(faces))
+    #end if
+    return cone_templates[key]
+#end get_cone_template
+
+def append_cone(verts, faces, segments, radius1, radius2, depth, matrix, cap_ends = True) :
+    # Appends the vertex coordinates and face vertex indices for a cone,
+    # laid out as per bmesh.ops.create_cone with cap_tris = False, to
+    # the verts and faces lists, ready for creating in one go with
+    # add_geometry.
+    template_verts, template_faces = get_cone_template \
+      (
+        segments,
+        cap_ends,
+        radius1 == 0,
+        radius2 == 0
+      )
+    offset = len(verts)
+    radii = (radius1, radius2)
+    heights = (- depth / 2, depth / 2)
+    for x, y, end in template_verts :
+        verts.append(matrix @ Vector((radii[end] * x, radii[end] * y, heights[end])))
+    #end for
+    faces.extend(tuple(offset + i for i in face) for face in template_faces)
+#end append_cone
+
+def add_geometry(bm, verts, faces) :
+    # Creates new vertices at the coordinates in verts, and new faces
+    # joining them as given by the lists of vertex indices in faces.
+    # Returns a dict with the new "verts" and "faces".
+    vert_new = bm.verts.new
+    face_new = bm.faces.new
+    new_verts = list(vert_new(co) for co in verts)
+    new_faces = list \
+      (
+        face_new(tuple(new_verts[i] for i in face))
+        for face in faces
+      )
+    return {"verts" : new_verts, "faces" : new_faces}
+#end add_geometry
+
 def get_face_matrix(face, pos = None) :
     # Returns a rough 4x4 transform matrix for a face (doesn't handle
     # distortion/shear) with optional position override.
     x_axis = (face.verts[1].co - face.verts[0].co).normalized()
     z_axis = -face.normal
     y_axis = z_axis.cross(x_axis)
-    if not pos :
+    if pos == None :
         pos = face.calc_center_bounds()
     #end if
 
     # Construct a 4x4 matrix from axes + position:
     # http://i.stack.imgur.com/3TnQP.png
-    mat = Matrix()
-    mat[0][0] = x_axis.x
-    mat[1][0] = x_axis.y
-    mat[2][0] = x_axis.z
-    mat[3][0] = 0
-    mat[0][1] = y_axis.x
-    mat[1][1] = y_axis.y
-    mat[2][1] = y_axis.z
-    mat[3][1] = 0
-    mat[0][2] = z_axis.x
-    mat[1][2] = z_axis.y
-    mat[2][2] = z_axis.z
-    mat[3][2] = 0
-    mat[0][3] = pos.x
-    mat[1][3] = pos.y
-    mat[2][3] = pos.z
-    mat[3][3] = 1
-    return mat
+    return \
+        Matrix \
+          ((
+            (x_axis.x, y_axis.x, z_axis.x, pos.x),
+            (x_axis.y, y_axis.y, z_axis.y, pos.y),
+            (x_axis.z, y_axis.z, z_axis.z, pos.z),
+            (0, 0, 0, 1),
+          ))
 #end get_face_matrix
 
+def get_face_space(face) :
+    # Returns a pair of 4x4 matrices (to_world, to_face) for transforming
+    # between world space and the local space of a face, centred on it.
+    # Unlike get_face_matrix, the axes are made exactly orthonormal, the
+    # x-axis being squared up to the normal if the first edge is not
+    # perpendicular to it (as with a non-planar face). So to_face can be
+    # built directly, and is the true inverse of to_world.
+    z_axis = -face.normal
+    y_axis = z_axis.cross(face.verts[1].co - face.verts[0].co).normalized()
+    x_axis = y_axis.cross(z_axis)
+    pos = face.calc_center_bounds()
+    to_world = \
+        Matrix \
+          ((
+            (x_axis.x, y_axis.x, z_axis.x, pos.x),
+            (x_axis.y, y_axis.y, z_axis.y, pos.y),
+            (x_axis.z, y_axis.z, z_axis.z, pos.z),
+            (0, 0, 0, 1),
+          ))
+    to_face = \
+        Matrix \
+          ((
+            (x_axis.x, x_axis.y, x_axis.z, - x_axis.dot(pos)),
+            (y_axis.x, y_axis.y, y_axis.z, - y_axis.dot(pos)),
+            (z_axis.x, z_axis.y, z_axis.z, - z_axis.dot(pos)),
+            (0, 0, 0, 1),
+          ))
+    return to_world, to_face
+#end get_face_space
+
+def get_face_grid(face, horizontal_step, vertical_step) :
+    # Returns an array of shape (horizontal_step, vertical_step, 3) of
+    # positions evenly spaced across the interior of a quad face:
+    # horizontal_step positions in the direction from verts[0] to verts[1],
+    # each with vertical_step positions from there across to the opposite edge.
+    corners = np.array(list(face.verts[i].co for i in range(4)))
+    h_fractions = (np.arange(1, horizontal_step + 1) / (horizontal_step + 1))[:, np.newaxis]
+    v_fractions = (np.arange(1, vertical_step + 1) / (vertical_step + 1))[:, np.newaxis]
+    top = corners[0] + h_fractions * (corners[1] - corners[0])
+    bottom = corners[3] + h_fractions * (corners[2] - corners[3])
+    return top[:, np.newaxis] + v_fractions * (bottom - top)[:, np.newaxis]
+#end get_face_grid
+
 def get_face_width_and_height(face) :
     # Returns the rough length and width of a quad face.
     # Assumes a perfect rectangle, but close enough.
-    if not face.is_valid or len(face.verts[:]) < 4 :
+    if not face.is_valid or len(face.verts) < 4 :
         return -1, -1
     #end if
     width = (face.verts[0].co - face.verts[1].co).length
@@ -203,16 +413,52 @@ def get_aspect_ratio(face) :
         return 1.0
     #end if
     face_aspect_ratio = max(0.01, face.edges[0].calc_length() / face.edges[1].calc_length())
-    if face_aspect_ratio < 1.0 :
-        face_aspect_ratio = 1.0 / face_aspect_ratio
-    #end if
-    return face_aspect_ratio
+    return max(face_aspect_ratio, 1.0 / face_aspect_ratio)
 #end get_aspect_ratio
 
-def is_rear_face(face) :
-    # is this face pointing behind the ship
-    return face.normal.x < -0.95
-#end is_rear_face
+def get_surface_centre(me) :
+    # Returns the area-weighted centre of the surface of mesh me, as used
+    # by the ORIGIN_CENTER_OF_MASS option of bpy.ops.object.origin_set:
+    # each polygon is fanned into triangles from its first vertex, and
+    # each triangle contributes its centroid weighted by its area, signed
+    # according to the polygon normal. As with Blender, a zero-area
+    # polygon or a zero total area falls back to the median of the
+    # vertices. Returns None if the mesh has no polygons.
+    nr_polys = len(me.polygons)
+    if nr_polys == 0 :
+        return None
+    #end if
+    coords = np.empty(len(me.vertices) * 3, dtype = np.float32)
+    me.vertices.foreach_get("co", coords)
+    coords = coords.reshape(-1, 3)
+    loop_verts = np.empty(len(me.loops), dtype = np.int32)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    loop_starts = np.empty(nr_polys, dtype = np.int32)
+    me.polygons.foreach_get("loop_start", loop_starts)
+    loop_totals = np.empty(nr_polys, dtype = np.int32)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    normals = np.empty(nr_polys * 3, dtype = np.float32)
+    me.polygons.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3)
+    nr_tris = np.maximum(loop_totals - 2, 0)
+    tri_polys = np.repeat(np.arange(nr_polys), nr_tris)
+    # index of second corner of each triangle within its polygon
+    tri_corners = np.arange(len(tri_polys)) - np.repeat(np.cumsum(nr_tris) - nr_tris, nr_tris) + 1
+    tri_starts = loop_starts[tri_polys]
+    v1 = coords[loop_verts[tri_starts]].astype(float)
+    v2 = coords[loop_verts[tri_starts + tri_corners]].astype(float)
+    v3 = coords[loop_verts[tri_starts + tri_corners + 1]].astype(float)
+    cross = np.cross(v2 - v1, v3 - v1)
+    areas = np.linalg.norm(cross, axis = 1) / 2 * np.sign((cross * normals[tri_polys]).sum(axis = 1))
+    poly_areas = np.bincount(tri_polys, weights = areas, minlength = nr_polys)
+    total_area = poly_areas.sum()
+    if total_area != 0 and np.all(poly_areas != 0) :
+        result = ((v1 + v2 + v3) / 3 * areas[:, np.newaxis]).sum(axis = 0) / total_area
+    else :
+        result = coords.mean(axis = 0, dtype = float)
+    #end if
+    return Vector(result.tolist())
+#end get_surface_centre
 
 class MATERIAL(enum.IntEnum) :
     "names for material slot indices. Must be densely-assigned from 0."
@@ -241,6 +487,40 @@ class MATERIAL(enum.IntEnum) :
 
 grunge_socket_name = "Grunge"
 
+node_groups_cache = {}
+  # names of the node groups built by create_materials, keyed on the
+  # parameters that determine their contents, or on a fixed key for
+  # the ones that do not depend on any parameters
+node_group_key_prop = "spaceship_key"
+  # custom property recording on each of those node groups the cache
+  # key it was built for
+
+def get_cached_node_group(key, index = None) :
+    # returns the node group recorded in node_groups_cache under key
+    # (at position index, if the entry is a tuple), provided it still
+    # exists and was built for that key. A name alone is not enough to
+    # go on, since undo, loading another file or purging orphans can
+    # free it for some other group to take.
+    group = None
+    if key in node_groups_cache :
+        name = node_groups_cache[key]
+        if index != None :
+            name = name[index]
+        #end if
+        group = bpy.data.node_groups.get(name)
+        if group != None and group.get(node_group_key_prop) != repr((key, index)) :
+            group = None
+        #end if
+    #end if
+    return group
+#end get_cached_node_group
+
+def set_cached_node_group_key(group, key, index = None) :
+    # records on group the node_groups_cache key it is being cached under,
+    # for checking by get_cached_node_group.
+    group[node_group_key_prop] = repr((key, index))
+#end set_cached_node_group_key
+
 def create_materials(parms) :
     # Creates all our materials and returns them as a list.
 
@@ -248,31 +528,32 @@ def create_materials(parms) :
     shiny_amt = 0.1
     shiny_rough = 0.5
     metallic_rough = 0.4
-    hull_dark_colour = None
-    metallic_colour = None
+    # RGBA colour for each material, used both in the colour scheme and
+    # for the viewport display, in MATERIAL order
+    material_colours = dict \
+      (
+        (mat, tuple(colour)[:3] + (1,))
+        for mat, colour in
+            (
+                (MATERIAL.HULL, parms.hull_base_colour),
+                (MATERIAL.HULL_LIGHTS, parms.hull_emissive_colour),
+                (MATERIAL.HULL_DARK, tuple(parms.hull_darken * x for x in parms.hull_base_colour[:3])),
+                (MATERIAL.HULL_METALLIC, hls_to_rgb((0.091, 0.9, 0.1)).tolist()),
+                (MATERIAL.EXHAUST_BURN, parms.glow_colour),
+                (MATERIAL.GLOW_DISC, parms.glow_colour),
+            )
+      )
 
     def define_colour_scheme() :
         # defines the common colour scheme.
-        nonlocal hull_dark_colour, metallic_colour
-        hull_dark_colour = tuple(parms.hull_darken * x for x in parms.hull_base_colour[:3])
-        metallic_colour = hls_to_rgb(h = 0.091, l = 0.9, s = 0.1) + (1,)
         colour_scheme = bpy.data.node_groups.new("SpaceShip.ColourScheme", "ShaderNodeTree")
         ctx = NodeContext(colour_scheme, (100, 0))
         group_output = ctx.node("NodeGroupOutput", ctx.step_across(-300))
         ctx.step_down(round(-100 * len(MATERIAL.__members__)))
-        for i, (mat, colour) in \
-            enumerate((
-                (MATERIAL.HULL, parms.hull_base_colour),
-                (MATERIAL.HULL_LIGHTS, parms.hull_emissive_colour),
-                (MATERIAL.HULL_DARK, hull_dark_colour),
-                (MATERIAL.HULL_METALLIC, metallic_colour),
-                (MATERIAL.EXHAUST_BURN, parms.glow_colour),
-                (MATERIAL.GLOW_DISC, parms.glow_colour),
-            )) \
-        :
+        for i, (mat, colour) in enumerate(material_colours.items()) :
             colour_node = ctx.node("ShaderNodeRGB", ctx.step_down(200))
             colour_node.label = mat.name
-            colour_node.outputs[0].default_value = tuple(colour)[:3] + (1,)
+            colour_node.outputs[0].default_value = colour
             colour_scheme.outputs.new("NodeSocketColor", mat.name)
             ctx.link(colour_node.outputs[0], group_output.inputs[i])
         #end for
@@ -291,8 +572,6 @@ def create_materials(parms) :
         return colour_scheme
     #end define_colour_scheme
 
-    colour_scheme = define_colour_scheme()
-
     def define_tex_coords_common() :
         # creates a node group that defines a common coordinate system
         # for all my image textures.
@@ -307,56 +586,62 @@ def create_materials(parms) :
         return tex_coords_common
     #end define_tex_coords_common
 
-    tex_coords_common = define_tex_coords_common()
-
     def define_hull_colour_common() :
         # creates a node group that applies the grunge factor to
-        # an input colour to produce an output colour.
+        # an input colour to produce an output colour. With a zero
+        # grunge factor this is just a passthrough, saving the noise
+        # texture evaluation.
         hull_common = bpy.data.node_groups.new("SpaceShip.HullColourCommon", "ShaderNodeTree")
         ctx = NodeContext(hull_common, (-400, 0))
         group_input = ctx.node("NodeGroupInput", ctx.step_down(100))
         hull_common.inputs.new("NodeSocketColor", "Colour")
-        save_pos = ctx.pos
-        colours = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colours.node_tree = colour_scheme
-        ctx.step_down(150)
-        strength_fanout = ctx.node("NodeReroute", ctx.step_across(100))
-        ctx.link(colours.outputs[grunge_socket_name], strength_fanout.inputs[0])
-        ctx.pos = save_pos
-        ctx.step_down(250)
-        dirty = ctx.node("ShaderNodeTexNoise", ctx.step_across(200))
-        dirty.inputs["Scale"].default_value = 20
-        dirtier = ctx.node("ShaderNodeBrightContrast", ctx.step_across(200))
-        ctx.link(dirty.outputs[0], dirtier.inputs[0])
-        dirtier.inputs[2].default_value = 2
-        grunge_fanout = ctx.node("NodeReroute", ctx.step_across(100))
-        ctx.link(dirtier.outputs[0], grunge_fanout.inputs[0])
-        ctx.pos = (ctx.pos[0], save_pos[1])
-        save_pos = ctx.pos
-        mix = ctx.node("ShaderNodeMixRGB", ctx.step_down(200))
-        mix.blend_type = "MULTIPLY"
-        ctx.link(strength_fanout.outputs[0], mix.inputs[0])
-        ctx.link(group_input.outputs[0], mix.inputs[1])
-        ctx.link(grunge_fanout.outputs[0], mix.inputs[2])
-        invert1 = ctx.node("ShaderNodeMath", ctx.step_across(200))
-        invert1.operation = "SUBTRACT"
-        invert1.inputs[0].default_value = 1
-        ctx.link(grunge_fanout.outputs[0], invert1.inputs[1])
-        scalarize = ctx.node("ShaderNodeMath", ctx.step_across(200))
-        scalarize.operation = "MULTIPLY"
-        ctx.link(strength_fanout.outputs[0], scalarize.inputs[0])
-        ctx.link(invert1.outputs[0], scalarize.inputs[1])
-        scalarize.inputs[2].default_value = 1
-        invert2 = ctx.node("ShaderNodeMath", ctx.step_across(200))
-        invert2.operation = "SUBTRACT"
-        invert2.inputs[0].default_value = 1
-        ctx.link(scalarize.outputs[0], invert2.inputs[1])
-        ctx.pos = (ctx.pos[0], save_pos[1])
+        if parms.grunge_factor != 0 :
+            save_pos = ctx.pos
+            colours = ctx.group_node(colour_scheme, ctx.step_across(200))
+            ctx.step_down(150)
+            strength_fanout = ctx.node("NodeReroute", ctx.step_across(100))
+            ctx.link(colours.outputs[grunge_socket_name], strength_fanout.inputs[0])
+            ctx.pos = save_pos
+            ctx.step_down(250)
+            dirty = ctx.node("ShaderNodeTexNoise", ctx.step_across(200))
+            dirty.inputs["Scale"].default_value = 20
+            dirtier = ctx.node("ShaderNodeBrightContrast", ctx.step_across(200))
+            ctx.link(dirty.outputs[0], dirtier.inputs[0])
+            dirtier.inputs[2].default_value = 2
+            grunge_fanout = ctx.node("NodeReroute", ctx.step_across(100))
+            ctx.link(dirtier.outputs[0], grunge_fanout.inputs[0])
+            ctx.pos = (ctx.pos[0], save_pos[1])
+            save_pos = ctx.pos
+            mix = ctx.node("ShaderNodeMixRGB", ctx.step_down(200))
+            mix.blend_type = "MULTIPLY"
+            ctx.link(strength_fanout.outputs[0], mix.inputs[0])
+            ctx.link(group_input.outputs[0], mix.inputs[1])
+            ctx.link(grunge_fanout.outputs[0], mix.inputs[2])
+            # grunge output is 1 - strength * (1 - grunge), i.e. strength
+            # mapped from [0, 1] onto [1, grunge]
+            scalarize = ctx.node("ShaderNodeMapRange", ctx.step_across(200))
+            scalarize.clamp = False
+            ctx.link(strength_fanout.outputs[0], scalarize.inputs[0]) # Value
+            scalarize.inputs[1].default_value = 0 # From Min
+            scalarize.inputs[2].default_value = 1 # From Max
+            scalarize.inputs[3].default_value = 1 # To Min
+            ctx.link(grunge_fanout.outputs[0], scalarize.inputs[4]) # To Max
+            ctx.pos = (ctx.pos[0], save_pos[1])
+            colour_out = mix.outputs[0]
+            grunge_out = scalarize.outputs[0]
+        else :
+            # no grunge: the colour passes straight through, and the grunge
+            # output is the constant 1 that the full graph gives at zero strength
+            no_grunge = ctx.node("ShaderNodeValue", ctx.step_across(200))
+            no_grunge.outputs[0].default_value = 1
+            colour_out = group_input.outputs[0]
+            grunge_out = no_grunge.outputs[0]
+        #end if
         group_output = ctx.node("NodeGroupOutput", ctx.step_across(200))
         hull_common.outputs.new("NodeSocketColor", "Colour")
-        ctx.link(mix.outputs[0], group_output.inputs[0])
+        ctx.link(colour_out, group_output.inputs[0])
         hull_common.outputs.new("NodeSocketFloat", "Grunge")
-        ctx.link(invert2.outputs[0], group_output.inputs[1])
+        ctx.link(grunge_out, group_output.inputs[1])
         group_input.outputs[0].name = hull_common.inputs[0].name
         group_output.inputs[0].name = hull_common.outputs[0].name
         group_output.inputs[1].name = hull_common.outputs[1].name
@@ -364,20 +649,41 @@ def create_materials(parms) :
         return hull_common
     #end define_hull_colour_common
 
-    hull_colour_common = define_hull_colour_common()
-
-    def create_texture(ctx, filename, use_alpha, is_colour) :
-        # Creates an image texture node given filename relative to my
-        # “textures” subdirectory. Returns the output terminal to be linked
-        # to wherever the texture colour is needed.
-        img = load_image(filename, use_alpha, is_colour)
-        coords = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        coords.node_tree = tex_coords_common
+    def define_texture(filename, use_alpha, is_colour) :
+        # defines a node group that samples the image texture given by
+        # filename relative to my “textures” subdirectory, using the
+        # common texture coordinates.
+        texture = bpy.data.node_groups.new \
+          (
+            "SpaceShip.Tex.%s" % os.path.splitext(filename)[0],
+            "ShaderNodeTree"
+          )
+        ctx = NodeContext(texture, (-400, 0))
+        coords = ctx.group_node(tex_coords_common, ctx.step_across(200))
         tex = ctx.node("ShaderNodeTexImage", ctx.step_across(300))
-        tex.image = img
+        tex.image = load_image(filename, use_alpha, is_colour)
         tex.projection = "BOX"
         ctx.link(coords.outputs[0], tex.inputs[0])
-        return tex.outputs["Color"]
+        group_output = ctx.node("NodeGroupOutput", ctx.step_across(200))
+        texture.outputs.new("NodeSocketColor", "Color")
+        ctx.link(tex.outputs["Color"], group_output.inputs[0])
+        group_output.inputs[0].name = texture.outputs[0].name
+        deselect_all(texture)
+        return texture
+    #end define_texture
+
+    def create_texture(ctx, filename, use_alpha, is_colour) :
+        # Creates a node instantiating the shared texture group for
+        # filename relative to my “textures” subdirectory. Returns the
+        # output terminal to be linked to wherever the texture colour
+        # is needed.
+        texture = get_shared_node_group \
+          (
+            ("texture", filename, use_alpha, is_colour),
+            lambda : define_texture(filename, use_alpha, is_colour)
+          )
+        tex = ctx.group_node(texture, ctx.step_across(300))
+        return tex.outputs[0]
     #end create_texture
 
     def define_normals_common() :
@@ -403,8 +709,6 @@ def create_materials(parms) :
         return normals_common
     #end define_normals_common
 
-    normals_common = define_normals_common()
-
     def define_hull_mat_common() :
         # defines a common node group defining characteristics of most hull materials.
         hull_mat_common = bpy.data.node_groups.new("SpaceShip.HullCommon", "ShaderNodeTree")
@@ -412,11 +716,9 @@ def create_materials(parms) :
         group_input = ctx.node("NodeGroupInput", ctx.step_across(200))
         hull_mat_common.inputs.new("NodeSocketColor", "Colour")
         save_pos = ctx.pos
-        colour_mix = ctx.node("ShaderNodeGroup", ctx.step_down(200))
-        colour_mix.node_tree = hull_colour_common
+        colour_mix = ctx.group_node(hull_colour_common, ctx.step_down(200))
         ctx.link(group_input.outputs[0], colour_mix.inputs["Colour"])
-        normal_map = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        normal_map.node_tree = normals_common
+        normal_map = ctx.group_node(normals_common, ctx.step_across(200))
         ctx.pos = (ctx.pos[0], save_pos[1])
         save_pos = ctx.pos
         ctx.step_down(200)
@@ -442,34 +744,31 @@ def create_materials(parms) :
         group_output = ctx.node("NodeGroupOutput", ctx.step_across(200))
         hull_mat_common.outputs.new("NodeSocketShader", "Shader")
         ctx.link(mix_shader.outputs[0], group_output.inputs[0])
+        hull_mat_common.outputs.new("NodeSocketFloat", "Grunge")
+        ctx.link(colour_mix.outputs[1], group_output.inputs[1])
+        group_output.inputs[1].name = hull_mat_common.outputs[1].name
         deselect_all(hull_mat_common)
         return hull_mat_common
     #end define_hull_mat_common
 
-    hull_mat_common = define_hull_mat_common()
-
-    def set_hull_mat_basics(mat, base_colour, viewport_colour) :
+    def set_hull_mat_basics(mat, base_colour) :
         # Sets some basic properties for a hull material.
         ctx = NodeContext(mat.node_tree, (-200, 0), clear = True)
-        colours = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colours.node_tree = colour_scheme
-        mat_base = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        mat_base.node_tree = hull_mat_common
+        colours = ctx.group_node(colour_scheme, ctx.step_across(200))
+        mat_base = ctx.group_node(hull_mat_common, ctx.step_across(200))
         ctx.link(colours.outputs[base_colour.name], mat_base.inputs[0])
         material_output = ctx.node("ShaderNodeOutputMaterial", ctx.step_across(200))
         ctx.link(mat_base.outputs[0], material_output.inputs[0])
         deselect_all(mat.node_tree)
-        mat.diffuse_color = tuple(viewport_colour)[:3] + (1,)
+        mat.diffuse_color = material_colours[base_colour]
         mat.specular_intensity = shiny_amt
         mat.roughness = shiny_rough
     #end set_hull_mat_basics
 
     def set_metallic(mat, colour) :
         ctx = NodeContext(mat.node_tree, (-200, 0), clear = True)
-        colours = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colours.node_tree = colour_scheme
-        colour_mix = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colour_mix.node_tree = hull_colour_common
+        colours = ctx.group_node(colour_scheme, ctx.step_across(200))
+        colour_mix = ctx.group_node(hull_colour_common, ctx.step_across(200))
         ctx.link(colours.outputs[colour.name], colour_mix.inputs["Colour"])
         shiny = ctx.node("ShaderNodeBsdfGlossy", ctx.step_across(200))
         ctx.link(colour_mix.outputs[0], shiny.inputs["Color"])
@@ -477,18 +776,16 @@ def create_materials(parms) :
         material_output = ctx.node("ShaderNodeOutputMaterial", ctx.step_across(200))
         ctx.link(shiny.outputs[0], material_output.inputs[0])
         deselect_all(ctx.graph)
-        mat.diffuse_color = tuple(metallic_colour)[:3] + (1,)
+        mat.diffuse_color = material_colours[colour]
         mat.metallic = 1.0
         mat.roughness = metallic_rough
     #end set_metallic
 
-    def setup_hull_lights(mat, viewport_colour) :
+    def setup_hull_lights(mat) :
         ctx = NodeContext(mat.node_tree, (-600, 0), clear = True)
         save1_pos = ctx.pos
-        colours = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colours.node_tree = colour_scheme
-        mat_base = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        mat_base.node_tree = hull_mat_common
+        colours = ctx.group_node(colour_scheme, ctx.step_across(200))
+        mat_base = ctx.group_node(hull_mat_common, ctx.step_across(200))
         ctx.link(colours.outputs[MATERIAL.HULL.name], mat_base.inputs[0])
         ctx.pos = save1_pos
         ctx.step_down(250)
@@ -500,16 +797,11 @@ def create_materials(parms) :
             use_alpha = False,
             is_colour = True
           )
-        save2_pos = ctx.pos
-        ctx.step_down(300)
-        ctx.step_across(-200)
-        grunge_source = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        grunge_source.node_tree = hull_colour_common
-        ctx.pos = (ctx.pos[0], save2_pos[1])
         grunge_mix = ctx.node("ShaderNodeMath", ctx.step_across(200))
         grunge_mix.operation = "MULTIPLY"
         ctx.link(window_light, grunge_mix.inputs[0])
-        ctx.link(grunge_source.outputs[1], grunge_mix.inputs[1])
+        # reuse the grunge already computed within the hull material
+        ctx.link(mat_base.outputs["Grunge"], grunge_mix.inputs[1])
         brighter = ctx.node("ShaderNodeMath", ctx.step_across(200))
         brighter.operation = "MULTIPLY"
         ctx.link(grunge_mix.outputs[0], brighter.inputs[0])
@@ -524,27 +816,68 @@ def create_materials(parms) :
         material_output = ctx.node("ShaderNodeOutputMaterial", ctx.step_across(200))
         ctx.link(add_shader.outputs[0], material_output.inputs[0])
         deselect_all(ctx.graph)
-        mat.diffuse_color = tuple(viewport_colour)[:3] + (1,)
+        mat.diffuse_color = material_colours[MATERIAL.HULL_LIGHTS]
         mat.specular_intensity = shiny_amt
         mat.roughness = shiny_rough
     #end setup_hull_lights
 
-    def set_hull_mat_emissive(mat, colour, strength, viewport_colour) :
+    def set_hull_mat_emissive(mat, colour, strength) :
         # does common setup for very basic emissive hull materials (engines, landing discs)
         ctx = NodeContext(mat.node_tree, (-300, 0), clear = True)
-        colours = ctx.node("ShaderNodeGroup", ctx.step_across(200))
-        colours.node_tree = colour_scheme
+        colours = ctx.group_node(colour_scheme, ctx.step_across(200))
         emit = ctx.node("ShaderNodeEmission", ctx.step_across(200))
         ctx.link(colours.outputs[colour.name], emit.inputs["Color"])
         emit.inputs["Strength"].default_value = strength
         material_output = ctx.node("ShaderNodeOutputMaterial", ctx.step_across(200))
         ctx.link(emit.outputs[0], material_output.inputs[0])
         deselect_all(mat.node_tree)
-        mat.diffuse_color = tuple(viewport_colour)[:3] + (1,)
+        mat.diffuse_color = material_colours[colour]
     #end set_hull_mat_emissive
 
+    def get_shared_node_group(key, define) :
+        # returns the settings-independent node group identified by key,
+        # reusing the one from a previous call if it is still present in
+        # bpy.data.node_groups, otherwise calling define to create it.
+        group = get_cached_node_group(key)
+        if group == None :
+            group = define()
+            set_cached_node_group_key(group, key)
+            node_groups_cache[key] = group.name
+        #end if
+        return group
+    #end get_shared_node_group
+
 #begin create_materials
 
+    # These node groups do not depend on any settings, so all ships
+    # can share the same ones.
+    tex_coords_common = get_shared_node_group("tex_coords_common", define_tex_coords_common)
+    normals_common = get_shared_node_group("normals_common", define_normals_common)
+
+    # The remaining node groups depend only on these settings, so ships
+    # sharing the same settings can share the same node groups.
+    cache_key = \
+        (
+            tuple(parms.hull_base_colour),
+            parms.hull_darken,
+            tuple(parms.hull_emissive_colour),
+            tuple(parms.glow_colour),
+            parms.grunge_factor,
+        )
+    node_groups = tuple(get_cached_node_group(cache_key, i) for i in range(3))
+    if None not in node_groups :
+        colour_scheme, hull_colour_common, hull_mat_common = node_groups
+    else :
+        colour_scheme = define_colour_scheme()
+        hull_colour_common = define_hull_colour_common()
+        hull_mat_common = define_hull_mat_common()
+        node_groups = (colour_scheme, hull_colour_common, hull_mat_common)
+        for i, group in enumerate(node_groups) :
+            set_cached_node_group_key(group, cache_key, i)
+        #end for
+        node_groups_cache[cache_key] = tuple(group.name for group in node_groups)
+    #end if
+
     materials = []
     for material in MATERIAL :
         mat = bpy.data.materials.new(material.name.lower())
@@ -553,21 +886,21 @@ def create_materials(parms) :
     #end for
 
     # Build the hull texture
-    set_hull_mat_basics(materials[MATERIAL.HULL], MATERIAL.HULL, parms.hull_base_colour)
+    set_hull_mat_basics(materials[MATERIAL.HULL], MATERIAL.HULL)
 
-    setup_hull_lights(materials[MATERIAL.HULL_LIGHTS], parms.hull_emissive_colour)
+    setup_hull_lights(materials[MATERIAL.HULL_LIGHTS])
 
     # Build the hull_dark texture
-    set_hull_mat_basics(materials[MATERIAL.HULL_DARK], MATERIAL.HULL_DARK, hull_dark_colour)
+    set_hull_mat_basics(materials[MATERIAL.HULL_DARK], MATERIAL.HULL_DARK)
 
     # build the metallic material
     set_metallic(materials[MATERIAL.HULL_METALLIC], MATERIAL.HULL_METALLIC)
 
     # Build the exhaust_burn texture
-    set_hull_mat_emissive(materials[MATERIAL.EXHAUST_BURN], MATERIAL.EXHAUST_BURN, 1.0, parms.glow_colour)
+    set_hull_mat_emissive(materials[MATERIAL.EXHAUST_BURN], MATERIAL.EXHAUST_BURN, 1.0)
 
     # Build the glow_disc texture
-    set_hull_mat_emissive(materials[MATERIAL.GLOW_DISC], MATERIAL.GLOW_DISC, 1.0, parms.glow_colour)
+    set_hull_mat_emissive(materials[MATERIAL.GLOW_DISC], MATERIAL.GLOW_DISC, 1.0)
 
     return materials
 #end create_materials
@@ -610,21 +943,20 @@ class parms_defaults :
 #end parms_defaults
 
 def randomize_colours(parms, mat_random) :
-    # Choose a base colour for the spaceship hull
-    parms.hull_base_colour = hls_to_rgb \
+    # Choose all the colours as (h, l, s) triples, and convert them in one go.
+    parms.hull_base_colour, parms.hull_emissive_colour, parms.glow_colour = map \
       (
-        h = mat_random.random(),
-        l = mat_random.uniform(0.05, 0.5),
-        s = mat_random.uniform(0, 0.25)
+        tuple,
+        hls_to_rgb
+          ((
+            # base colour for the spaceship hull
+            (mat_random.random(), mat_random.uniform(0.05, 0.5), mat_random.uniform(0, 0.25)),
+            # emissive colour for the hull windows
+            (mat_random.random(), mat_random.uniform(0.5, 1), mat_random.uniform(0, 0.5)),
+            # glow colour for the exhaust + glow discs
+            (mat_random.random(), mat_random.uniform(0.5, 1), 1),
+          )).tolist()
       )
-    parms.hull_emissive_colour = hls_to_rgb \
-      (
-        h = mat_random.random(),
-        l = mat_random.uniform(0.5, 1),
-        s = mat_random.uniform(0, 0.5)
-      )
-    # Choose a glow colour for the exhaust + glow discs
-    parms.glow_colour = hls_to_rgb(h = mat_random.random(), l = mat_random.uniform(0.5, 1), s = 1)
 #end randomize_colours
 
 def generate_spaceship(parms) :
@@ -636,6 +968,19 @@ def generate_spaceship(parms) :
     if parms.geom_ranseed != "" :
         geom_random.seed(parms.geom_ranseed)
     #end if
+    # bound methods for the draws, saves looking them up every time
+    random = geom_random.random
+    uniform = geom_random.uniform
+    randint = geom_random.randint
+    randrange = geom_random.randrange
+    # plain int material indices for the per-face assignments, saves
+    # going through the IntEnum machinery every time
+    MI_HULL = int(MATERIAL.HULL)
+    MI_HULL_LIGHTS = int(MATERIAL.HULL_LIGHTS)
+    MI_HULL_DARK = int(MATERIAL.HULL_DARK)
+    MI_HULL_METALLIC = int(MATERIAL.HULL_METALLIC)
+    MI_EXHAUST_BURN = int(MATERIAL.EXHAUST_BURN)
+    MI_GLOW_DISC = int(MATERIAL.GLOW_DISC)
 
     def add_exhaust_to_face(bm, face) :
         # Given a face, splits it into a uniform grid and extrudes each grid face
@@ -645,31 +990,26 @@ def generate_spaceship(parms) :
         #end if
 
         # The more square the face is, the more grid divisions it might have
-        num_cuts = geom_random.randint(1, int(4 - get_aspect_ratio(face)))
+        num_cuts = randint(1, int(4 - get_aspect_ratio(face)))
         result = bmesh.ops.subdivide_edges \
           (
             bm,
-            edges = face.edges[:],
+            edges = face.edges,
             cuts = num_cuts,
             fractal = 0.02,
             use_grid_fill = True
           )
-        exhaust_length = geom_random.uniform(0.1, 0.2)
-        scale_outer = 1 / geom_random.uniform(1.3, 1.6)
-        scale_inner = 1 / geom_random.uniform(1.05, 1.1)
+        exhaust_length = uniform(0.1, 0.2)
+        scale_outer = 1 / uniform(1.3, 1.6)
+        scale_inner = 1 / uniform(1.05, 1.1)
         for face in result["geom"] :
-            if isinstance(face, bmesh.types.BMFace) :
-                if is_rear_face(face) :
-                    face.material_index = MATERIAL.HULL_DARK
-                    face = extrude_face(bm, face, exhaust_length)
-                    scale_face(bm, face, scale_outer, scale_outer, scale_outer)
-                    extruded_face_list = []
-                    face = extrude_face(bm, face, -exhaust_length * 0.9, extruded_face_list)
-                    for extruded_face in extruded_face_list :
-                        extruded_face.material_index = MATERIAL.EXHAUST_BURN
-                    #end for
-                    scale_face(bm, face, scale_inner, scale_inner, scale_inner)
-                #end if
+            if type(face) is BMFace and face.normal.x < -0.95 : # pointing behind the ship
+                face.material_index = MI_HULL_DARK
+                face = extrude_face(bm, face, exhaust_length)
+                scale_face(face, scale_outer)
+                face = extrude_face(bm, face, -exhaust_length * 0.9)
+                face.material_index = MI_EXHAUST_BURN
+                scale_face(face, scale_inner)
             #end if
         #end for
     #end add_exhaust_to_face
@@ -682,37 +1022,34 @@ def generate_spaceship(parms) :
         result = bmesh.ops.subdivide_edges \
           (
             bm,
-            edges = face.edges[:],
-            cuts = geom_random.randint(2, 4),
+            edges = face.edges,
+            cuts = randint(2, 4),
             fractal = 0.02,
             use_grid_fill = True,
             use_single_edge = False
           )
-        grid_length = geom_random.uniform(0.025, 0.15)
+        grid_length = uniform(0.025, 0.15)
         scale = 0.8
         for face in result["geom"] :
-            if isinstance(face, bmesh.types.BMFace) :
-                material_index = (MATERIAL.HULL, MATERIAL.HULL_LIGHTS)[geom_random.random() > 0.5]
-                extruded_face_list = []
-                face = extrude_face(bm, face, grid_length, extruded_face_list)
-                for extruded_face in extruded_face_list :
-                    if abs(face.normal.z) < 0.707 : # side face
-                        extruded_face.material_index = material_index
-                    #end if
-                #end for
-                scale_face(bm, face, scale, scale, scale)
+            if type(face) is BMFace :
+                material_index = (MI_HULL, MI_HULL_LIGHTS)[random() > 0.5]
+                face = extrude_face(bm, face, grid_length)
+                if abs(face.normal.z) < 0.707 : # side face
+                    face.material_index = material_index
+                #end if
+                scale_face(face, scale)
             #end if
         #end for
     #end add_grid_to_face
 
     def add_cylinders_to_face(bm, face) :
         # Given a face, adds some cylinders along it in a grid pattern.
-        if not face.is_valid or len(face.verts[:]) < 4 :
+        if not face.is_valid or len(face.verts) < 4 :
             return
         #end if
-        horizontal_step = geom_random.randint(1, 3)
-        vertical_step = geom_random.randint(1, 3)
-        num_segments = geom_random.randint(6, 12)
+        horizontal_step = randint(1, 3)
+        vertical_step = randint(1, 3)
+        num_segments = randint(6, 12)
         face_width, face_height = get_face_width_and_height(face)
         cylinder_depth = \
           (
@@ -725,30 +1062,17 @@ def generate_spaceship(parms) :
                   )
           )
         cylinder_size = cylinder_depth * 0.5
-        for h in range(horizontal_step) :
-            top = face.verts[0].co.lerp \
-              (
-                face.verts[1].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            bottom = face.verts[3].co.lerp \
-              (
-                face.verts[2].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            for v in range(vertical_step) :
-                pos = top.lerp(bottom, (v + 1) / (vertical_step + 1))
-                cylinder_matrix = \
-                  (
-                        get_face_matrix(face, pos)
-                    @
-                        Matrix.Rotation(90 * deg, 3, "X").to_4x4()
-                  )
-                bmesh.ops.create_cone \
+        # the orientation is the same for every cylinder, only the position changes
+        cylinder_matrix = get_face_matrix(face) @ ROT_X_90
+        verts = []
+        faces = []
+        for row in get_face_grid(face, horizontal_step, vertical_step) :
+            for pos in row :
+                cylinder_matrix.translation = pos.tolist()
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = num_segments,
                     radius1 = cylinder_size,
                     radius2 = cylinder_size,
@@ -757,16 +1081,17 @@ def generate_spaceship(parms) :
                   )
             #end for
         #end for
+        add_geometry(bm, verts, faces)
     #end add_cylinders_to_face
 
     def add_weapons_to_face(bm, face) :
         # Given a face, adds some weapon turrets to it in a grid pattern.
         # Each turret will have a random orientation.
-        if not face.is_valid or len(face.verts[:]) < 4 :
+        if not face.is_valid or len(face.verts) < 4 :
             return
         #end if
-        horizontal_step = geom_random.randint(1, 2)
-        vertical_step = geom_random.randint(1, 2)
+        horizontal_step = randint(1, 2)
+        vertical_step = randint(1, 2)
         num_segments = 16
         face_width, face_height = get_face_width_and_height(face)
         weapon_size = \
@@ -780,32 +1105,27 @@ def generate_spaceship(parms) :
                   )
           )
         weapon_depth = weapon_size * 0.2
-        for h in range(horizontal_step) :
-            top = face.verts[0].co.lerp \
-              (
-                face.verts[1].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            bottom = face.verts[3].co.lerp \
-              (
-                face.verts[2].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            for v in range(vertical_step) :
-                pos = top.lerp(bottom, (v + 1) / (vertical_step + 1))
-                face_matrix = \
-                  (
-                        get_face_matrix(face, pos + face.normal * weapon_depth * 0.5)
-                    @
-                        Matrix.Rotation(geom_random.uniform(0, 90) * deg, 3, "Z").to_4x4()
-                  )
+        # these only depend on the face and the weapon size, not on the
+        # individual turret
+        base_matrix = get_face_matrix(face)
+        base_offset = face.normal * weapon_depth * 0.5
+        left_guard = ROT_Y_90 @ Matrix.Translation(Vector((0, 0, weapon_size * 0.6)))
+        right_guard = ROT_Y_90 @ Matrix.Translation(Vector((0, 0, weapon_size * -0.6)))
+        house_offset = Matrix.Translation(Vector((0, weapon_size * -0.4, 0)))
+        left_barrel = Matrix.Translation(Vector((weapon_size * 0.2, 0, -weapon_size)))
+        right_barrel = Matrix.Translation(Vector((weapon_size * -0.2, 0, -weapon_size)))
+        verts = []
+        faces = []
+        for row in get_face_grid(face, horizontal_step, vertical_step) :
+            for pos in row :
+                base_matrix.translation = Vector(pos) + base_offset
+                face_matrix = base_matrix @ Matrix.Rotation(uniform(0, 90) * deg, 4, "Z")
 
                 # Turret foundation
-                bmesh.ops.create_cone \
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = num_segments,
                     radius1 = weapon_size * 0.9,
                     radius2 = weapon_size,
@@ -813,54 +1133,34 @@ def generate_spaceship(parms) :
                     matrix = face_matrix
                   )
                 # Turret left guard
-                bmesh.ops.create_cone \
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = num_segments,
                     radius1 = weapon_size * 0.6,
                     radius2 = weapon_size * 0.5,
                     depth = weapon_depth * 2,
-                    matrix =
-                            face_matrix
-                        @
-                            Matrix.Rotation(90 * deg, 3, "Y").to_4x4()
-                        @
-                            Matrix.Translation(Vector((0, 0, weapon_size * 0.6))).to_4x4()
+                    matrix = face_matrix @ left_guard
                   )
                 # Turret right guard
-                bmesh.ops.create_cone \
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = num_segments,
                     radius1 = weapon_size * 0.5,
                     radius2 = weapon_size * 0.6,
                     depth = weapon_depth * 2,
-                    matrix =
-                            face_matrix
-                        @
-                            Matrix.Rotation(90 * deg, 3, "Y").to_4x4()
-                        @
-                            Matrix.Translation(Vector((0, 0, weapon_size * -0.6))).to_4x4()
+                    matrix = face_matrix @ right_guard
                   )
                 # Turret housing
-                upward_angle = geom_random.uniform(0, 45) * deg
-                turret_house_mat = \
+                upward_angle = uniform(0, 45) * deg
+                turret_house_mat = face_matrix @ Matrix.Rotation(upward_angle, 4, "X") @ house_offset
+                append_cone \
                   (
-                        face_matrix
-                    @
-                        Matrix.Rotation(upward_angle, 3, "X").to_4x4()
-                    @
-                        Matrix.Translation(Vector((0, weapon_size * -0.4, 0))).to_4x4()
-                  )
-                bmesh.ops.create_cone \
-                  (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = 8,
                     radius1 = weapon_size * 0.4,
                     radius2 = weapon_size * 0.4,
@@ -868,36 +1168,29 @@ def generate_spaceship(parms) :
                     matrix = turret_house_mat
                   )
                 # Turret barrels L + R
-                bmesh.ops.create_cone \
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = 8,
                     radius1 = weapon_size * 0.1,
                     radius2 = weapon_size * 0.1,
                     depth = weapon_depth * 6,
-                    matrix =
-                            turret_house_mat
-                        @
-                            Matrix.Translation(Vector((weapon_size * 0.2, 0, -weapon_size))).to_4x4()
+                    matrix = turret_house_mat @ left_barrel
                   )
-                bmesh.ops.create_cone \
+                append_cone \
                   (
-                    bm,
-                    cap_ends = True,
-                    cap_tris = False,
+                    verts,
+                    faces,
                     segments = 8,
                     radius1 = weapon_size * 0.1,
                     radius2 = weapon_size * 0.1,
                     depth = weapon_depth * 6,
-                    matrix =
-                            turret_house_mat
-                        @
-                            Matrix.Translation(Vector((weapon_size * -0.2, 0, -weapon_size))).to_4x4()
+                    matrix = turret_house_mat @ right_barrel
                   )
-            #end for v in range(vertical_step)
-        #end for h in range(horizontal_step)
+            #end for pos
+        #end for row
+        add_geometry(bm, verts, faces)
     #end add_weapons_to_face
 
     def add_sphere_to_face(bm, face) :
@@ -906,11 +1199,11 @@ def generate_spaceship(parms) :
             return
         #end if
         face_width, face_height = get_face_width_and_height(face)
-        sphere_size = geom_random.uniform(0.4, 1.0) * min(face_width, face_height)
+        sphere_size = uniform(0.4, 1.0) * min(face_width, face_height)
         sphere_matrix = get_face_matrix \
           (
             face,
-            face.calc_center_bounds() - face.normal * geom_random.uniform(0, sphere_size * 0.5)
+            face.calc_center_bounds() - face.normal * uniform(0, sphere_size * 0.5)
           )
         result = bmesh.ops.create_icosphere \
           (
@@ -919,79 +1212,67 @@ def generate_spaceship(parms) :
             radius = sphere_size,
             matrix = sphere_matrix
           )
-        for vert in result["verts"] :
-            for face in vert.link_faces :
-                face.material_index = MATERIAL.HULL
-            #end for
+        # create_icosphere only returns the verts, so collect each face once
+        for face in set(face for vert in result["verts"] for face in vert.link_faces) :
+            face.material_index = MI_HULL
         #end for
     #end add_sphere_to_face
 
     def add_surface_antenna_to_face(bm, face) :
         # Given a face, adds some pointy intimidating antennas.
-        if not face.is_valid or len(face.verts[:]) < 4 :
+        if not face.is_valid or len(face.verts) < 4 :
             return
         #end if
-        horizontal_step = geom_random.randint(4, 10)
-        vertical_step = geom_random.randint(4, 10)
-        for h in range(horizontal_step) :
-            top = face.verts[0].co.lerp \
-              (
-                face.verts[1].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            bottom = face.verts[3].co.lerp \
-              (
-                face.verts[2].co,
-                (h + 1) / (horizontal_step + 1)
-              )
-            for v in range(vertical_step) :
-                if geom_random.random() > 0.9 :
-                    pos = top.lerp(bottom, (v + 1) / (vertical_step + 1))
-                    face_size = math.sqrt(face.calc_area())
-                    depth = geom_random.uniform(0.1, 1.5) * face_size
-                    depth_short = depth * geom_random.uniform(0.02, 0.15)
-                    base_radius = geom_random.uniform(0.005, 0.05)
-                    material_index = MATERIAL.HULL_METALLIC
-
-                    # Spire
-                    num_segments = geom_random.randint(3, 6)
-                    result = bmesh.ops.create_cone \
+        horizontal_step = randint(4, 10)
+        vertical_step = randint(4, 10)
+        # the face itself is not changed by adding the antennas
+        face_size = math.sqrt(face.calc_area())
+        face_normal = face.normal.copy()
+        face_matrix = get_face_matrix(face)
+        for row in get_face_grid(face, horizontal_step, vertical_step) :
+            for pos in row :
+                if random() > 0.9 :
+                    pos = Vector(pos)
+                    depth = uniform(0.1, 1.5) * face_size
+                    depth_short = depth * uniform(0.02, 0.15)
+                    base_radius = uniform(0.005, 0.05)
+                    material_index = MI_HULL_METALLIC
+
+                    # Spire and base, created together
+                    num_segments = randint(3, 6)
+                    verts = []
+                    faces = []
+                    matrix = face_matrix.copy()
+                    matrix.translation = pos + face_normal * depth * 0.5
+                    append_cone \
                       (
-                        bm,
-                        cap_ends = False,
-                        cap_tris = False,
+                        verts,
+                        faces,
                         segments = num_segments,
                         radius1 = 0,
                         radius2 = base_radius,
                         depth = depth,
-                        matrix = get_face_matrix(face, pos + face.normal * depth * 0.5)
+                        matrix = matrix,
+                        cap_ends = False
                       )
-                    for vert in result["verts"] :
-                        for vert_face in vert.link_faces :
-                            vert_face.material_index = material_index
-                        #end for
-                    #end for
-
-                    # Base
-                    result = bmesh.ops.create_cone \
+                    matrix.translation = pos + face_normal * depth_short * 0.45
+                    append_cone \
                       (
-                        bm,
-                        cap_ends = True,
-                        cap_tris = False,
+                        verts,
+                        faces,
                         segments = num_segments,
-                        radius1 = base_radius * geom_random.uniform(1, 1.5),
-                        radius2 = base_radius * geom_random.uniform(1.5, 2),
+                        radius1 = base_radius * uniform(1, 1.5),
+                        radius2 = base_radius * uniform(1.5, 2),
                         depth = depth_short,
-                        matrix = get_face_matrix(face, pos + face.normal * depth_short * 0.45)
+                        matrix = matrix
                       )
-                    for vert in result["verts"] :
-                        for vert_face in vert.link_faces :
-                            vert_face.material_index = material_index
-                        #end for
+                    result = add_geometry(bm, verts, faces)
+                    for new_face in result["faces"] :
+                        new_face.material_index = material_index
                     #end for
-                #end if geom_random.random() > 0.9
-            #end for v in range(vertical_step)
-        #end for h in range(horizontal_step)
+                #end if random() > 0.9
+            #end for pos
+        #end for row
     #end add_surface_antenna_to_face
 
     def add_disc_to_face(bm, face) :
@@ -1001,32 +1282,37 @@ def generate_spaceship(parms) :
         #end if
         face_width, face_height = get_face_width_and_height(face)
         depth = 0.125 * min(face_width, face_height)
-        bmesh.ops.create_cone \
+        centre = face.calc_center_bounds()
+        normal = face.normal.copy()
+        matrix = get_face_matrix(face, centre + normal * depth * 0.5)
+        verts = []
+        faces = []
+        append_cone \
           (
-            bm,
-            cap_ends = True,
-            cap_tris = False,
+            verts,
+            faces,
             segments = 32,
             radius1 = depth * 3,
             radius2 = depth * 4,
-            depth=depth,
-            matrix = get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 0.5)
+            depth = depth,
+            matrix = matrix
           )
-        result = bmesh.ops.create_cone \
+        nr_pad_faces = len(faces)
+        matrix.translation = centre + normal * depth * 1.05
+        append_cone \
           (
-            bm,
-            cap_ends = False,
-            cap_tris = False,
+            verts,
+            faces,
             segments = 32,
             radius1 = depth * 1.25,
             radius2 = depth * 2.25,
             depth = 0.0,
-            matrix = get_face_matrix(face, face.calc_center_bounds() + face.normal * depth * 1.05)
+            matrix = matrix,
+            cap_ends = False
           )
-        for vert in result["verts"] :
-            for face in vert.link_faces :
-                face.material_index = MATERIAL.GLOW_DISC
-            #end for
+        result = add_geometry(bm, verts, faces)
+        for new_face in result["faces"][nr_pad_faces:] :
+            new_face.material_index = MI_GLOW_DISC
         #end for
     #end add_disc_to_face
 
@@ -1036,18 +1322,22 @@ def generate_spaceship(parms) :
     bmesh.ops.create_cube(bm, size = 1)
     scale_vector = Vector \
       ((
-        geom_random.uniform(0.75, 2.0),
-        geom_random.uniform(0.75, 2.0),
-        geom_random.uniform(0.75, 2.0),
+        uniform(0.75, 2.0),
+        uniform(0.75, 2.0),
+        uniform(0.75, 2.0),
       ))
-    bmesh.ops.scale(bm, vec = scale_vector, verts = bm.verts)
+    for vert in bm.verts :
+        vert.co.x *= scale_vector.x
+        vert.co.y *= scale_vector.y
+        vert.co.z *= scale_vector.z
+    #end for
 
     # Extrude out the hull along the X axis, adding some semi-random perturbations
     for face in bm.faces[:] :
         if abs(face.normal.x) > 0.5 :
-            hull_segment_length = geom_random.uniform(0.3, 1)
+            hull_segment_length = uniform(0.3, 1)
             if parms.num_hull_segments_max >= parms.num_hull_segments_min :
-                num_hull_segments = geom_random.randrange \
+                num_hull_segments = randrange \
                   (
                     parms.num_hull_segments_min,
                     parms.num_hull_segments_max + 1
@@ -1055,14 +1345,14 @@ def generate_spaceship(parms) :
             else :
                 num_hull_segments = parms.num_hull_segments_min # or something
             #end if
-            hull_segment_range = range(num_hull_segments)
-            for i in hull_segment_range :
-                is_last_hull_segment = i == hull_segment_range[-1]
-                val = geom_random.random()
+            last_hull_segment = num_hull_segments - 1
+            for i in range(num_hull_segments) :
+                is_last_hull_segment = i == last_hull_segment
+                val = random()
                 if val > 0.1 :
                     # Most of the time, extrude out the face with some random deviations
                     face = extrude_face(bm, face, hull_segment_length)
-                    if geom_random.random() > 0.75 :
+                    if random() > 0.75 :
                         face = extrude_face \
                           (
                             bm,
@@ -1071,60 +1361,64 @@ def generate_spaceship(parms) :
                           )
                     #end if
 
+                    # The scaling, sideways translation and rotation below
+                    # are accumulated into one transform, applied to the
+                    # face verts in a single pass at the end
+                    transform = None
+
                     # Maybe apply some scaling
-                    if geom_random.random() > 0.5 :
-                        sy = geom_random.uniform(1.2, 1.5)
-                        sz = geom_random.uniform(1.2, 1.5)
-                        if is_last_hull_segment or geom_random.random() > 0.5 :
+                    if random() > 0.5 :
+                        sy = uniform(1.2, 1.5)
+                        sz = uniform(1.2, 1.5)
+                        if is_last_hull_segment or random() > 0.5 :
                             sy = 1 / sy
                             sz = 1 / sz
-                        scale_face(bm, face, 1, sy, sz)
+                        #end if
+                        # scale in face space, about the face centre
+                        to_world, to_face = get_face_space(face)
+                        transform = to_world @ Matrix.Diagonal((1, sy, sz, 1)) @ to_face
                     #end if
 
                     # Maybe apply some sideways translation
-                    if geom_random.random() > 0.5 :
-                        sideways_translation = Vector \
-                          (
-                            (0, 0, geom_random.uniform(0.1, 0.4) * scale_vector.z * hull_segment_length)
-                          )
-                        if geom_random.random() > 0.5 :
+                    if random() > 0.5 :
+                        sideways_translation = uniform(0.1, 0.4) * scale_vector.z * hull_segment_length
+                        if random() > 0.5 :
                             sideways_translation = -sideways_translation
                         #end if
-                        bmesh.ops.translate \
-                          (
-                            bm,
-                            vec = sideways_translation,
-                            verts = face.verts
-                          )
+                        translation = Matrix.Translation((0, 0, sideways_translation))
+                        if transform != None :
+                            translation = translation @ transform
+                        #end if
+                        transform = translation
                     #end if
 
                     # Maybe add some rotation around Y axis
-                    if geom_random.random() > 0.5 :
-                        angle = 5 * deg
-                        if geom_random.random() > 0.5 :
-                            angle = -angle
+                    if random() > 0.5 :
+                        rotation = (ROT_Y_5, ROT_Y_MINUS_5)[random() > 0.5]
+                        if transform != None :
+                            rotation = rotation @ transform
                         #end if
-                        bmesh.ops.rotate \
-                          (
-                            bm,
-                            verts = face.verts,
-                            cent = (0, 0, 0),
-                            matrix = Matrix.Rotation(angle, 3, "Y")
-                          )
+                        transform = rotation
+                    #end if
+
+                    if transform != None :
+                        for vert in face.verts :
+                            vert.co = transform @ vert.co
+                        #end for
                     #end if
                 else : #  val <= 0.1
                     # Rarely, create a ribbed section of the hull
-                    rib_scale = geom_random.uniform(0.75, 0.95)
+                    rib_scale = uniform(0.75, 0.95)
                     face = ribbed_extrude_face \
                       (
                         bm,
                         face,
                         translate_forwards = hull_segment_length,
-                        num_ribs = geom_random.randint(2, 4),
+                        num_ribs = randint(2, 4),
                         rib_scale = rib_scale
                       )
                 #end if val > 0.1
-            #end for i in hull_segment_range
+            #end for i in range(num_hull_segments)
         #end if abs(face.normal.x) > 0.5
     #end for face in bm.faces[:]
 
@@ -1139,11 +1433,11 @@ def generate_spaceship(parms) :
                     get_aspect_ratio(face) <= 4
                       # Skip any long thin faces as it'll probably look stupid
                 and
-                    geom_random.random() > 0.85
+                    random() > 0.85
             ) :
-                hull_piece_length = geom_random.uniform(0.1, 0.4)
+                hull_piece_length = uniform(0.1, 0.4)
                 for i in \
-                    range(geom_random.randrange
+                    range(randrange
                       (
                         parms.num_asymmetry_segments_min,
                         parms.num_asymmetry_segments_max + 1
@@ -1151,9 +1445,9 @@ def generate_spaceship(parms) :
                 :
                     face = extrude_face(bm, face, hull_piece_length)
                     # Maybe apply some scaling
-                    if geom_random.random() > 0.25 :
-                        s = 1 / geom_random.uniform(1.1, 1.5)
-                        scale_face(bm, face, s, s, s)
+                    if random() > 0.25 :
+                        s = 1 / uniform(1.1, 1.5)
+                        scale_face(face, s)
                     #end if
                 #end for
             #end if
@@ -1169,62 +1463,91 @@ def generate_spaceship(parms) :
         sphere_faces = []
         disc_faces = []
         cylinder_faces = []
-        for face in bm.faces[:] :
-            # Skip any long thin faces as it'll probably look stupid
-            if get_aspect_ratio(face) > 3 :
-                continue
+        # Gather what is needed to categorize all the faces in one go
+        faces = bm.faces[:]
+        normals = np.array(list(face.normal[:] for face in faces), dtype = float).reshape(-1, 3)
+        edge_lengths = np.array \
+          (
+            list((face.edges[0].calc_length(), face.edges[1].calc_length()) for face in faces),
+            dtype = float
+          ).reshape(-1, 2)
+        aspect_ratios = np.maximum(0.01, edge_lengths[:, 0] / edge_lengths[:, 1])
+        aspect_ratios = np.maximum(aspect_ratios, 1 / aspect_ratios)
+          # same as get_aspect_ratio
+        # Skip any long thin faces as it'll probably look stupid
+        keep = np.flatnonzero(aspect_ratios <= 3)
+        faces = list(faces[i] for i in keep)
+        normals = normals[keep]
+        # Spin the wheel! One draw per face, in face order as always
+        vals = np.array(list(random() for face in faces), dtype = float)
+        nx, ny, nz = normals[:, 0], normals[:, 1], normals[:, 2]
+        rear = nx < -0.95
+        front = ~rear & (nx > 0.9)
+        top = ~rear & ~front & (nz > 0.9)
+        # only front and top faces need their centres, for the antenna test
+        outward = np.zeros(len(faces), dtype = bool)
+        for i in np.flatnonzero(front | top).tolist() :
+            outward[i] = faces[i].normal.dot(faces[i].calc_center_bounds()) > 0
+        #end for
+        bottom = ~rear & ~front & ~top & (nz < -0.9)
+        side = ~rear & ~front & ~top & ~bottom & (np.abs(ny) > 0.9)
+        categories = (engine_faces, grid_faces, antenna_faces, weapon_faces, sphere_faces, disc_faces, cylinder_faces)
+        ENGINE, GRID, ANTENNA, WEAPON, SPHERE, DISC, CYLINDER = range(len(categories))
+        NO_CATEGORY = -1
+        category = np.select \
+          (
+            [ # first matching condition wins, as in an if/elif chain
+                rear & (vals > 0.75),
+                rear & (vals > 0.5),
+                rear & (vals > 0.25),
+                front & outward & (vals > 0.7), # front facing antenna
+                front & (vals > 0.4),
+                top & outward & (vals > 0.7), # top facing antenna
+                top & (vals > 0.6),
+                top & (vals > 0.3),
+                bottom & (vals > 0.75),
+                bottom & (vals > 0.5),
+                bottom & (vals > 0.25),
+                side & (vals > 0.75),
+                side & (vals > 0.6),
+                side & (vals > 0.4),
+            ],
+            [
+                ENGINE, CYLINDER, GRID,
+                ANTENNA, GRID,
+                ANTENNA, GRID, CYLINDER,
+                DISC, GRID, WEAPON,
+                WEAPON, GRID, SPHERE,
+            ],
+            NO_CATEGORY
+          )
+        # The first rear face always gets an engine, and the first side face
+        # gets weapons unless a bottom face before it already did.
+        rear_indices = np.flatnonzero(rear)
+        if len(rear_indices) != 0 :
+            category[rear_indices[0]] = ENGINE
+        #end if
+        side_indices = np.flatnonzero(side)
+        if len(side_indices) != 0 :
+            first_side = side_indices[0]
+            if not (category[:first_side] == WEAPON).any() :
+                category[first_side] = WEAPON
             #end if
-
-            # Spin the wheel! Let's categorize + assign some materials
-            val = geom_random.random()
-            if is_rear_face(face) :
-                if not engine_faces or val > 0.75 :
-                    engine_faces.append(face)
-                elif val > 0.5 :
-                    cylinder_faces.append(face)
-                elif val > 0.25 :
-                    grid_faces.append(face)
-                else :
-                    face.material_index = MATERIAL.HULL_LIGHTS
-                #end if
-            elif face.normal.x > 0.9 :  # front face
-                if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7 :
-                    antenna_faces.append(face)  # front facing antenna
-                    face.material_index = MATERIAL.HULL_LIGHTS
-                elif val > 0.4 :
-                    grid_faces.append(face)
-                else :
-                    face.material_index = MATERIAL.HULL_LIGHTS
-                #end if
-            elif face.normal.z > 0.9 :  # top face
-                if face.normal.dot(face.calc_center_bounds()) > 0 and val > 0.7 :
-                    antenna_faces.append(face)  # top facing antenna
-                elif val > 0.6 :
-                    grid_faces.append(face)
-                elif val > 0.3 :
-                    cylinder_faces.append(face)
-                #end if
-            elif face.normal.z < -0.9 :  # bottom face
-                if val > 0.75 :
-                    disc_faces.append(face)
-                elif val > 0.5 :
-                    grid_faces.append(face)
-                elif val > 0.25 :
-                    weapon_faces.append(face)
-                #end if
-            elif abs(face.normal.y) > 0.9 :  # side face
-                if not weapon_faces or val > 0.75 :
-                    weapon_faces.append(face)
-                elif val > 0.6 :
-                    grid_faces.append(face)
-                elif val > 0.4 :
-                    sphere_faces.append(face)
-                else :
-                    face.material_index = MATERIAL.HULL_LIGHTS
-                #end if
+        #end if
+        lights = \
+            (
+                (rear | front | side) & (category == NO_CATEGORY)
+            |
+                front & (category == ANTENNA)
+            )
+        for face, face_category, face_lights in zip(faces, category.tolist(), lights.tolist()) :
+            if face_category != NO_CATEGORY :
+                categories[face_category].append(face)
             #end if
-
-        #end for face in bm.faces[:]
+            if face_lights :
+                face.material_index = MI_HULL_LIGHTS
+            #end if
+        #end for face
 
         # Now we've categorized, let's actually add the detail
         for face in engine_faces :
@@ -1252,12 +1575,12 @@ def generate_spaceship(parms) :
     #end if parms.create_face_detail
 
     # Apply horizontal symmetry sometimes
-    if parms.allow_horizontal_symmetry and geom_random.random() > 0.5 :
-        bmesh.ops.symmetrize(bm, input = bm.verts[:] + bm.edges[:] + bm.faces[:], direction = "Y")
+    if parms.allow_horizontal_symmetry and random() > 0.5 :
+        bmesh.ops.symmetrize(bm, input = all_geom(bm), direction = "Y")
     #end if
     # Apply vertical symmetry sometimes - this can cause spaceship "islands", so disabled by default
-    if parms.allow_vertical_symmetry and geom_random.random() > 0.5 :
-        bmesh.ops.symmetrize(bm, input = bm.verts[:] + bm.edges[:] + bm.faces[:], direction = "Z")
+    if parms.allow_vertical_symmetry and random() > 0.5 :
+        bmesh.ops.symmetrize(bm, input = all_geom(bm), direction = "Z")
     #end if
 
     # Finish up, write the bmesh into a new mesh
@@ -1279,10 +1602,10 @@ def generate_spaceship(parms) :
         orient = Matrix.Identity(4)
     #end if
     if parms.align in (ALIGN_TO.VIEW.idstr, ALIGN_TO.CURSOR.idstr) :
-        orient = orient @ Matrix.Rotation(-90 * deg, 4, Vector((1, 0, 0)))
+        orient = orient @ ROT_X_MINUS_90
     #end if
     if parms.align != ALIGN_TO.NONE.idstr :
-        orient = orient @ Matrix.Rotation(-90 * deg, 4, Vector((0, 0, 1)))
+        orient = orient @ ROT_Z_MINUS_90
     #end if
     if parms.align != ALIGN_TO.CURSOR.idstr :
         orient = Matrix.Translation(bpy.context.scene.cursor.location) @ orient
@@ -1293,7 +1616,7 @@ def generate_spaceship(parms) :
     if parms.add_bevel_modifier :
         # Add a fairly broad bevel modifier to angularize shape
         bevel_modifier = obj.modifiers.new("Bevel", "BEVEL")
-        bevel_modifier.width = geom_random.uniform(5, 20)
+        bevel_modifier.width = uniform(5, 20)
         bevel_modifier.offset_type = "PERCENT"
         bevel_modifier.segments = 2
         bevel_modifier.profile = 0.25
@@ -1302,28 +1625,36 @@ def generate_spaceship(parms) :
     #end if
 
     # Add materials to the spaceship
+    # (the face material indices already came across with bm.to_mesh)
     me = obj.data
     if parms.create_materials :
         materials = create_materials(parms)
-        for mat in materials :
-            me.materials.append(mat)
-        #end for
     else :
         mat = bpy.data.materials.get("Material")
         if mat == None :
             mat = bpy.data.materials.new(name = "Material")
         #end if
-        for i in range(len(MATERIAL.__members__)) :
-            me.materials.append(mat)
-        #end for
+        materials = [mat] * len(MATERIAL)
     #end if
+    append_material = me.materials.append
+    for mat in materials :
+        append_material(mat)
+    #end for
 
     # Select and make active
-    bpy.ops.object.select_all(action = "DESELECT")
+    for other in list(bpy.context.view_layer.objects.selected) :
+        other.select_set(False)
+    #end for
     obj.select_set(True)
     bpy.context.view_layer.objects.active = obj
-    # Recenter the object to its center of mass
-    bpy.ops.object.origin_set(type = "ORIGIN_CENTER_OF_MASS")
+    # Recenter the object to its center of mass, the same as
+    # origin_set(type = "ORIGIN_CENTER_OF_MASS") would, but without
+    # going through an operator
+    centre = get_surface_centre(me)
+    if centre != None :
+        me.transform(Matrix.Translation(- centre))
+        obj.matrix_basis = obj.matrix_basis @ Matrix.Translation(centre)
+    #end if
 
     return obj
 #end generate_spaceship